@@ -1,18 +1,106 @@
+import asyncio
+import functools
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
 from sys import stderr
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 import httpx
-import pandas as pd
+import ijson
+import orjson
 import typer
 from loguru import logger
-from pydantic import EmailStr, Field, ValidationError
-from pydantic_settings import BaseSettings
 from rich import print as rprint
+from rich.markup import escape
+from rich.table import Table
 
 from cf_empty_email.__version__ import __version__
+from cf_empty_email.ratelimit import RateLimitedClient, RateLimitError
+
+if TYPE_CHECKING:
+    from cf_empty_email.settings import Settings
 
 __author__ = "ubahmapk@proton.me"
 
+CF_API_URL: str = "https://api.cloudflare.com/client/v4"
+
+# Upper bound on the number of requests in flight at once
+MAX_CONCURRENT_REQUESTS: int = 8
+
+# The /zones listing is cached on disk for a short while to save a round trip on repeated runs
+ZONE_CACHE_DIR: Path = Path.home() / ".cache" / "cf-empty-email"
+ZONE_CACHE_TTL: int = 60
+
+# Zone name -> id lookups built from the listing, per cache file, for the life of the process
+_zone_indexes: dict[Path, dict[str, str]] = {}
+
+# The only DNS record fields this tool looks at
+DNS_RECORD_FIELDS: tuple[str, ...] = ("id", "type", "name", "content", "modified_on")
+
+
+# SPF, DKIM and DMARC records start with their version tag
+EMAIL_TXT_PREFIXES: tuple[tuple[str, str], ...] = (("v=spf1", "spf"), ("v=DKIM1", "dkim"), ("v=DMARC1", "dmarc"))
+
+# TXT record content must be wrapped in quotes
+SPF_RECORD: dict = {
+    "comment": "Reject all senders SPF record",
+    "type": "TXT",
+    "name": "@",
+    "content": '"v=spf1 -all"',
+}
+
+DKIM_RECORD: dict = {
+    "comment": "Reject all DKIM record",
+    "type": "TXT",
+    "name": "*._domainkey",
+    "content": '"v=DKIM1; p="',
+}
+
+DMARC_RECORD: dict = {
+    "comment": "DMARC reject all record",
+    "type": "TXT",
+    "name": "_dmarc",
+    "content": '"v=DMARC1;p=reject;sp=reject;adkim=s;aspf=s"',
+}
+
+# Null MX records for the root domain and for all subdomains
+MX_RECORDS: list[dict] = [
+    {
+        "comment": "Null mail server for root domain",
+        "type": "MX",
+        "name": "@",
+        "content": ".",
+        "priority": 0,
+        "proxied": False,
+        "ttl": 1,
+    },
+    {
+        "comment": "Null mail server for all subdomains",
+        "type": "MX",
+        "name": "*",
+        "content": ".",
+        "priority": 0,
+        "proxied": False,
+        "ttl": 1,
+    },
+]
+
+# The record payloads never change, so serialize the request bodies once at import
+_SPF_BODY: bytes = orjson.dumps(SPF_RECORD)
+_DKIM_BODY: bytes = orjson.dumps(DKIM_RECORD)
+_DMARC_BODY: bytes = orjson.dumps(DMARC_RECORD)
+_MX_BODIES: tuple[bytes, ...] = tuple(orjson.dumps(record) for record in MX_RECORDS)
+_BATCH_BODY: bytes = orjson.dumps({"posts": [*MX_RECORDS, SPF_RECORD, DKIM_RECORD, DMARC_RECORD]})
+
+# Responses from the batch endpoint that mean it isn't supported, rather than that the records were rejected
+BATCH_UNSUPPORTED_STATUSES: frozenset[int] = frozenset({httpx.codes.NOT_FOUND, httpx.codes.METHOD_NOT_ALLOWED})
+
+# Used with pre-serialized bodies, where httpx can't infer the content type
+JSON_HEADERS: dict[str, str] = {"Content-Type": "application/json"}
+
 
 class ZoneNotFoundError(Exception):
     pass
@@ -26,43 +114,48 @@ class CreateRecordError(Exception):
     pass
 
 
-class Settings(BaseSettings):
-    cf_api_key: str = Field(pattern=r"^[a-zA-Z0-9_]*$")
-    cf_api_email: EmailStr
+@functools.lru_cache(maxsize=1)
+def _get_settings() -> "Settings":
+    """Load and validate the settings from the environment once per process."""
+
+    # pydantic is only imported once credentials are needed, which keeps --version fast
+    from cf_empty_email.settings import Settings
+
+    return Settings()  # pyright: ignore[reportCallIssue]
+
+
+LOG_LEVELS: dict[int, str] = {0: "ERROR", 1: "INFO"}
+
+# loguru's default stderr handler has id 0
+_log_handler_id: int = 0
+_log_level: str | None = None
 
 
 def set_logging_level(verbosity: int) -> None:
     """Set the global logging level"""
 
-    # Default level
-    log_level = "INFO"
+    global _log_handler_id, _log_level
 
-    if verbosity is not None:
-        if verbosity == 1:
-            log_level = "INFO"
-        elif verbosity > 1:
-            log_level = "DEBUG"
-        else:
-            log_level = "ERROR"
+    log_level: str = "INFO" if verbosity is None else LOG_LEVELS.get(verbosity, "DEBUG")
 
-    logger.remove(0)
-    # noinspection PyUnboundLocalVariable
-    logger.add(stderr, level=log_level)
+    # Only swap the handler when the level actually changes
+    if log_level == _log_level:
+        return None
+
+    logger.remove(_log_handler_id)
+    _log_handler_id = logger.add(stderr, level=log_level)
+    _log_level = log_level
 
     return None
 
 
-def retrieve_cf_credentials() -> tuple[str, str]:
+def retrieve_cf_credentials() -> "Settings":
     """Retrieve Cloudflare API credentials from environment variables"""
 
-    cf_api_key: str = ""
-    cf_api_email: str = ""
+    from pydantic import ValidationError
 
     try:
-        settings = Settings()  # pyright: ignore[reportCallIssue]
-        cf_api_key = settings.cf_api_key
-        cf_api_email = settings.cf_api_email
-
+        settings: Settings = _get_settings()
     except ValidationError:
         message: str = "CloudFlare credentials are not set or are invalid.\n"
         message += "Please set the CF_API_KEY and CF_API_EMAIL environment variables."
@@ -71,14 +164,102 @@ def retrieve_cf_credentials() -> tuple[str, str]:
 
     logger.debug("Cloudflare credentials found in environment")
 
-    return cf_api_key, cf_api_email
+    return settings
+
+
+def zone_cache_path(client: httpx.AsyncClient) -> Path:
+    """Return the zone cache file for the account the client is authenticated as."""
+
+    account: str = client.headers.get("X-Auth-Email", "")
+    digest: str = hashlib.sha256(account.encode()).hexdigest()[:16]
 
+    return ZONE_CACHE_DIR / f"zones-{digest}.json"
+
+
+def drop_zone_cache(client: httpx.AsyncClient) -> None:
+    """Forget the cached zones for the client's account, on disk and in memory."""
+
+    cache_file: Path = zone_cache_path(client)
+    cache_file.unlink(missing_ok=True)
+    _zone_indexes.pop(cache_file, None)
+
+    return None
+
+
+def write_private_file(path: Path, content: bytes) -> None:
+    """Replace the file in one step, so it is only readable by the user and never seen half written."""
+
+    # mkstemp creates the file with mode 0o600
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    temp_path: Path = Path(temp_name)
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            temp_file.write(content)
+        temp_path.replace(path)
+    except OSError:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    return None
+
+
+async def _cached_zones(client: httpx.AsyncClient, ttl: int = ZONE_CACHE_TTL) -> list[dict]:
+    """Return the /zones listing, from the disk cache if it is fresher than ttl seconds."""
+
+    cache_file: Path = zone_cache_path(client)
+
+    try:
+        if time.time() - cache_file.stat().st_mtime < ttl:
+            logger.debug(f"Using cached zones from {cache_file}")
+            return orjson.loads(cache_file.read_bytes())
+    except (OSError, ValueError):
+        pass
+
+    try:
+        response: httpx.Response = await client.get("/zones")
+        response.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        if exc.response.is_client_error:
+            drop_zone_cache(client)
+        raise
+
+    # The listing also carries owner and account details, which are never needed or cached
+    try:
+        result: list[dict] = [
+            {"name": zone["name"], "id": zone["id"]} for zone in orjson.loads(response.content)["result"]
+        ]
+    except (orjson.JSONDecodeError, KeyError, TypeError) as exc:
+        raise ZoneNotFoundError(f"Unexpected response when listing zones: {exc!r}") from exc
+
+    try:
+        cache_file.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        write_private_file(cache_file, orjson.dumps(result))
+    except OSError as exc:
+        logger.debug(f"Unable to write zone cache {cache_file}: {exc}")
+
+    return result
 
-def list_cf_zones(client: httpx.Client, cf_api_email: str) -> None:
+
+async def _zone_index(client: httpx.AsyncClient, ttl: int = ZONE_CACHE_TTL) -> dict[str, str]:
+    """Return a zone name -> zone ID lookup, reusing the one already built in this process."""
+
+    cache_file: Path = zone_cache_path(client)
+
+    if ttl > 0 and cache_file in _zone_indexes:
+        return _zone_indexes[cache_file]
+
+    result: list[dict] = await _cached_zones(client, ttl=ttl)
+    zone_index: dict[str, str] = {zone["name"]: zone["id"] for zone in result}
+    _zone_indexes[cache_file] = zone_index
+
+    return zone_index
+
+
+async def list_cf_zones(client: httpx.AsyncClient, cf_api_email: str) -> None:
     """List all zones available to the user."""
 
     try:
-        result: dict = client.get("/zones").json()["result"]
+        result: list[dict] = await _cached_zones(client)
     except httpx.HTTPError as exc:
         raise ZoneNotFoundError("Unable to retrieve ZoneID") from exc
 
@@ -89,20 +270,24 @@ def list_cf_zones(client: httpx.Client, cf_api_email: str) -> None:
     return None
 
 
-def get_zone_id(client: httpx.Client, cf_zone: str) -> str:
+async def get_zone_id(client: httpx.AsyncClient, cf_zone: str) -> str:
     """Return the CF zone ID for a given Zone name."""
 
     zone_id: str = ""
 
     try:
         logger.debug(f"In get_zone_id: {cf_zone=}")
-        result: dict = client.get("/zones").json()["result"]
+        zone_index: dict[str, str] = await _zone_index(client)
+
+        # The zone may have been added since the listing was cached
+        if cf_zone not in zone_index:
+            zone_index = await _zone_index(client, ttl=0)
     except httpx.HTTPError as exc:
         raise ZoneNotFoundError(f"Unable to retrieve ZoneID for {cf_zone}\nError details: {exc}") from exc
 
     try:
-        zone_id = next(zone["id"] for zone in result if zone["name"] == cf_zone)
-    except StopIteration:
+        zone_id = zone_index[cf_zone]
+    except KeyError:
         rprint(f"Zone [bold red]{cf_zone}[/bold red] not found")
         raise typer.Abort() from None
 
@@ -110,19 +295,41 @@ def get_zone_id(client: httpx.Client, cf_zone: str) -> str:
     return zone_id
 
 
-def retrieve_dns_records(client: httpx.Client, zone_id: str) -> dict:
-    """Retrieve all DNS records for a given zone."""
+async def retrieve_dns_records(client: httpx.AsyncClient, zone_id: str) -> list[dict]:
+    """Retrieve all DNS records for a given zone.
+
+    The response is stream-parsed and only the fields used by this tool are kept for each record.
+    """
+
+    result: list[dict] = []
+    parsed_records = ijson.sendable_list()
+    parser = ijson.items_coro(parsed_records, "result.item")
 
     try:
         logger.debug(f"In retrieve_dns_records: {zone_id=}")
-        result: dict = client.get(f"/zones/{zone_id}/dns_records").json()["result"]
+        async with client.stream("GET", f"/zones/{zone_id}/dns_records") as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                parser.send(chunk)
+                result.extend({field: record[field] for field in DNS_RECORD_FIELDS} for record in parsed_records)
+                del parsed_records[:]
+        parser.close()
+        result.extend({field: record[field] for field in DNS_RECORD_FIELDS} for record in parsed_records)
+    except httpx.HTTPStatusError as exc:
+        # A cached zone ID may be stale, e.g. if the zone was deleted and added again
+        if exc.response.is_client_error:
+            drop_zone_cache(client)
+        raise ZoneNotFoundError(f"Unable to retrieve ZoneID for {zone_id}") from exc
     except httpx.HTTPError as exc:
         raise ZoneNotFoundError(f"Unable to retrieve ZoneID for {zone_id}") from exc
+    except (ijson.JSONError, KeyError, TypeError) as exc:
+        # e.g. an HTML error page from a proxy, or a body cut short
+        raise ZoneNotFoundError(f"Unexpected response for the DNS records of {zone_id}: {exc!r}") from exc
 
     return result
 
 
-def print_dns_records(dns_records: dict) -> None:
+def print_dns_records(dns_records: list[dict]) -> None:
     """Print all DNS records for a given zone."""
 
     if len(dns_records) == 0:
@@ -131,154 +338,346 @@ def print_dns_records(dns_records: dict) -> None:
         return None
 
     # Print the DNS records in a tabular format
-    df: pd.DataFrame = pd.DataFrame.from_dict(dns_records)
-    column_names: list[str] = ["modified_on", "name", "type", "content"]
-    column_headers: list[str] = ["Last Updated", "Host", "Type", "Address"]
-    print(df[column_names].to_string(index=False, header=column_headers, justify="right"))  # type: ignore [reportArgumentType, reportCallIssue]
+    # Values are folded onto extra lines rather than truncated, so nothing is lost on narrow terminals
+    table = Table(box=None, header_style="bold")
+    for column_header in ["Last Updated", "Host", "Type"]:
+        table.add_column(column_header, justify="right", no_wrap=True, overflow="fold")
+    table.add_column("Address", justify="right", overflow="fold")
+
+    for record in dns_records:
+        # Record content is arbitrary text, so keep rich from reading it as markup
+        table.add_row(record["modified_on"], record["name"], record["type"], escape(record["content"]))
+
+    rprint(table)
 
     return None
 
 
-def parse_for_mx_records(dns_records: dict) -> list[dict]:
-    """Check if there is already any MX records for the zone."""
+def email_record_kind(record: dict) -> str | None:
+    """Return which kind of email record this is ("mx", "spf", "dkim" or "dmarc"), if any."""
 
-    mx_records: list[dict] = [record for record in dns_records if record["type"] == "MX"]
+    record_type: str = record["type"]
+    if record_type == "MX":
+        return "mx"
 
-    return mx_records
+    if record_type == "TXT":
+        content: str = record["content"]
+        # Skip the opening quote, if the content has one
+        start: int = 1 if content.startswith('"') else 0
+        for prefix, kind in EMAIL_TXT_PREFIXES:
+            if content.startswith(prefix, start):
+                return kind
 
+    return None
 
-def parse_for_spf_records(dns_records: dict) -> list[dict]:
-    """Check if there is already an SPF records for the zone."""
 
-    spf_records: list[dict] = [
-        record for record in dns_records if record["type"] == "TXT" and "spf" in record["content"]
-    ]
+def classify_email_records(dns_records: list[dict]) -> dict[str, list[dict]]:
+    """Sort the email related records of a zone by kind in a single pass."""
 
-    return spf_records
+    email_records: dict[str, list[dict]] = {"mx": [], "spf": [], "dkim": [], "dmarc": []}
 
+    for record in dns_records:
+        kind: str | None = email_record_kind(record)
+        if kind is not None:
+            email_records[kind].append(record)
 
-def parse_for_dkim_records(dns_records: dict) -> list[dict]:
-    """Check if there is already any DKIM records for the zone."""
+    return email_records
 
-    dkim_records: list[dict] = [
-        record for record in dns_records if record["type"] == "TXT" and "DKIM" in record["content"]
-    ]
 
-    return dkim_records
+def email_records_exist(dns_records: list[dict]) -> dict[str, bool]:
+    """Report which kinds of email records exist, stopping as soon as all of them have been seen."""
+
+    found: dict[str, bool] = {"mx": False, "spf": False, "dkim": False, "dmarc": False}
+    remaining: int = len(found)
+
+    for record in dns_records:
+        kind: str | None = email_record_kind(record)
+        if kind is not None and not found[kind]:
+            found[kind] = True
+            remaining -= 1
+            if remaining == 0:
+                break
+
+    return found
 
 
-def parse_for_dmarc_records(dns_records: dict) -> list[dict]:
+def parse_for_mx_records(dns_records: list[dict]) -> list[dict]:
+    """Check if there is already any MX records for the zone."""
+
+    return classify_email_records(dns_records)["mx"]
+
+
+def parse_for_spf_records(dns_records: list[dict]) -> list[dict]:
+    """Check if there is already an SPF records for the zone."""
+
+    return classify_email_records(dns_records)["spf"]
+
+
+def parse_for_dkim_records(dns_records: list[dict]) -> list[dict]:
+    """Check if there is already any DKIM records for the zone."""
+
+    return classify_email_records(dns_records)["dkim"]
+
+
+def parse_for_dmarc_records(dns_records: list[dict]) -> list[dict]:
     """Check if there is already a DMARC record for the zone."""
 
-    dmarc_records: list[dict] = [
-        record for record in dns_records if record["type"] == "TXT" and "DMARC" in record["content"]
-    ]
+    return classify_email_records(dns_records)["dmarc"]
+
+
+def _rate_limit_note(message: str, results: list) -> str:
+    """Add the longest rate limit wait among the gathered results to an error message."""
 
-    return dmarc_records
+    rate_limited: list[RateLimitError] = [result for result in results if isinstance(result, RateLimitError)]
+    if rate_limited:
+        return f"{message}\n{max(rate_limited, key=lambda exc: exc.retry_after)}"
 
+    return message
 
-def post_record(client: httpx.Client, zone_id: str, record_data: dict) -> None:
-    """Post a DNS record for the zone."""
+
+async def post_record(client: httpx.AsyncClient, zone_id: str, record_body: bytes) -> None:
+    """Post a pre-serialized DNS record for the zone."""
 
     try:
-        client.post(f"/zones/{zone_id}/dns_records", json=record_data)
+        response: httpx.Response = await client.post(
+            f"/zones/{zone_id}/dns_records", content=record_body, headers=JSON_HEADERS
+        )
+        response.raise_for_status()
     except httpx.HTTPError as exc:
         raise CreateRecordError(f"Unable to create record for {zone_id}") from exc
 
     return None
 
 
-def create_dkim_record(client: httpx.Client, zone_id: str) -> None:
+async def create_dkim_record(client: httpx.AsyncClient, zone_id: str) -> None:
     """Create a DKIM record for the zone."""
 
-    # TXT record content must be wrapped in quotes
-    record_data = {
-        "comment": "Reject all DKIM record",
-        "type": "TXT",
-        "name": "*._domainkey",
-        "content": '"v=DKIM1; p="',
-    }
-
-    post_record(client=client, zone_id=zone_id, record_data=record_data)
+    await post_record(client=client, zone_id=zone_id, record_body=_DKIM_BODY)
 
     return None
 
 
-def create_spf_record(client: httpx.Client, zone_id: str) -> None:
+async def create_spf_record(client: httpx.AsyncClient, zone_id: str) -> None:
     """Create an SPF record for the zone."""
 
-    # TXT record content must be wrapped in quotes
-    record_data = {
-        "comment": "Reject all senders SPF record",
-        "type": "TXT",
-        "name": "@",
-        "content": '"v=spf1 -all"',
-    }
-
-    post_record(client=client, zone_id=zone_id, record_data=record_data)
+    await post_record(client=client, zone_id=zone_id, record_body=_SPF_BODY)
 
     return None
 
 
-def create_dmarc_record(client: httpx.Client, zone_id: str) -> None:
+async def create_dmarc_record(client: httpx.AsyncClient, zone_id: str) -> None:
     """Create a DMARC record for the zone."""
 
-    # TXT record content must be wrapped in quotes
-    record_data = {
-        "comment": "DMARC reject all record",
-        "type": "TXT",
-        "name": "_dmarc",
-        "content": '"v=DMARC1;p=reject;sp=reject;adkim=s;aspf=s"',
-    }
-
-    post_record(client=client, zone_id=zone_id, record_data=record_data)
+    await post_record(client=client, zone_id=zone_id, record_body=_DMARC_BODY)
 
     return None
 
 
-def create_mx_record(client: httpx.Client, zone_id: str) -> None:
+async def create_mx_record(client: httpx.AsyncClient, zone_id: str) -> None:
     """Create an null MX record for the root domain and any subdomains."""
 
-    record_data = [
-        {
-            "comment": "Null mail server for root domain",
-            "type": "MX",
-            "name": "@",
-            "content": ".",
-            "priority": 0,
-            "proxied": False,
-            "ttl": 1,
-        },
-        {
-            "comment": "Null mail server for all subdomains",
-            "type": "MX",
-            "name": "*",
-            "content": ".",
-            "priority": 0,
-            "proxied": False,
-            "ttl": 1,
-        },
-    ]
+    # Let both POSTs finish even if one of them fails
+    results: list = await asyncio.gather(
+        *(post_record(client=client, zone_id=zone_id, record_body=record_body) for record_body in _MX_BODIES),
+        return_exceptions=True,
+    )
+    for result in results:
+        # Being rate limited is the more useful thing to report
+        if isinstance(result, RateLimitError):
+            raise result
+    if any(isinstance(result, BaseException) for result in results):
+        raise CreateRecordError(f"Unable to create all MX records for {zone_id}")
+
+    return None
 
-    for record in record_data:
-        post_record(client=client, zone_id=zone_id, record_data=record)
+
+async def create_email_records_batch(client: httpx.AsyncClient, zone_id: str) -> None:
+    """Create all of the empty email records for the zone with a single batch request.
+
+    Falls back to concurrent POSTs, one per record, if the batch endpoint is not available.
+    """
+
+    try:
+        response: httpx.Response = await client.post(
+            f"/zones/{zone_id}/dns_records/batch", content=_BATCH_BODY, headers=JSON_HEADERS
+        )
+        response.raise_for_status()
+    except httpx.HTTPStatusError as exc:
+        # Only fall back when the batch endpoint itself is unavailable. Any other error (bad
+        # records, auth, rate limiting) would fail the same way for the single POSTs too
+        if exc.response.status_code not in BATCH_UNSUPPORTED_STATUSES:
+            raise CreateRecordError(f"Unable to create records for {zone_id}") from exc
+
+        logger.debug(f"Batch create failed with HTTP {exc.response.status_code}, creating records one at a time")
+        results: list = await asyncio.gather(
+            create_mx_record(client, zone_id),
+            create_spf_record(client, zone_id),
+            create_dkim_record(client, zone_id),
+            create_dmarc_record(client, zone_id),
+            return_exceptions=True,
+        )
+        failed: list[str] = [
+            kind
+            for kind, result in zip(("MX", "SPF", "DKIM", "DMARC"), results, strict=True)
+            if isinstance(result, BaseException)
+        ]
+        if failed:
+            message: str = f"Unable to create the {', '.join(failed)} records for {zone_id}"
+            raise CreateRecordError(_rate_limit_note(message, results)) from None
+    except httpx.HTTPError as exc:
+        raise CreateRecordError(f"Unable to create records for {zone_id}") from exc
+
+    return None
+
+
+async def delete_record(client: httpx.AsyncClient, zone_id: str, record_id: str, semaphore: asyncio.Semaphore) -> None:
+    """Delete a single record, waiting for a free slot in the semaphore."""
+
+    async with semaphore:
+        try:
+            response: httpx.Response = await client.delete(f"/zones/{zone_id}/dns_records/{record_id}")
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            raise DeleteRecordError(f"Unable to delete record {record_id} for {zone_id}") from exc
 
     return None
 
 
-def delete_records(records: list[dict], client: httpx.Client, zone_id: str) -> None:
+async def delete_records(records: list[dict], client: httpx.AsyncClient, zone_id: str) -> None:
     """Delete all records in the list"""
 
+    # Confirm every record up front, the prompts can't be interleaved with the requests
+    record_ids: list[str] = []
     for record in records:
         print(f"Record Name: {record['name']}")
         print(f"Record Type: {record['type']}")
         print(f"Record Content: {record['content']}")
         message: str = "Delete this record?"
         if typer.confirm(message, default=False, show_default=True):
+            record_ids.append(record["id"])
+
+    # Let every delete finish even if some fail, so the failures can all be reported
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    results: list = await asyncio.gather(
+        *(delete_record(client, zone_id, record_id, semaphore) for record_id in record_ids),
+        return_exceptions=True,
+    )
+
+    failed: list[str] = [
+        record_id for record_id, result in zip(record_ids, results, strict=True) if isinstance(result, BaseException)
+    ]
+    if failed:
+        message = f"Unable to delete {len(failed)} of {len(record_ids)} records for {zone_id}: {', '.join(failed)}"
+        raise DeleteRecordError(_rate_limit_note(message, results))
+
+    return None
+
+
+async def raise_on_error_status(response: httpx.Response) -> None:
+    """Response hook that turns 4xx and 5xx responses into httpx.HTTPStatusError."""
+
+    response.raise_for_status()
+
+    return None
+
+
+def build_client(client_headers: httpx.Headers, transport: httpx.AsyncBaseTransport | None = None) -> RateLimitedClient:
+    """Create the HTTP/2 client used to talk to the Cloudflare API.
+
+    A transport can be passed in to send the requests somewhere other than the network.
+    """
+
+    return RateLimitedClient(
+        base_url=CF_API_URL,
+        headers=client_headers,
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=30),
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        event_hooks={"response": [raise_on_error_status]},
+        transport=transport,
+    )
+
+
+async def run(cf_zone: str, print_only: bool, force: bool, settings: "Settings") -> None:
+    """Inspect the zone and, unless only printing, replace its email records."""
+
+    cf_zone_id: str = ""
+    dns_records: list[dict] = []
+
+    # One client for the whole run, so the connection is only set up once
+    async with build_client(settings.headers) as client:
+        if not cf_zone:
             try:
-                client.delete(f"/zones/{zone_id}/dns_records/{record['id']}")
-            except httpx.HTTPError as exc:
-                raise DeleteRecordError(f"Unable to delete record {record['id']} for {zone_id}") from exc
+                await list_cf_zones(client, settings.cf_api_email)
+            except ZoneNotFoundError:
+                rprint("[bold red]Unable to retrieve the list of zones[/bold red]")
+                raise typer.Exit(1) from None
+            return None
+
+        try:
+            cf_zone_id = await get_zone_id(client, cf_zone)
+            logger.debug(f"{cf_zone_id=}")
+        except ZoneNotFoundError:
+            rprint("[bold red]Unable to retrieve Zone ID[/bold red]")
+            raise typer.Exit(1) from None
+
+        try:
+            dns_records = await retrieve_dns_records(client, cf_zone_id)
+        except ZoneNotFoundError:
+            rprint(f"[bold red]Unable to retrieve DNS records for {cf_zone}[/bold red]")
+            raise typer.Exit(1) from None
+
+        records_exist: dict[str, bool] = email_records_exist(dns_records)
+
+        print(f"MX records exist: {records_exist['mx']}")
+        print(f"SPF records exist: {records_exist['spf']}")
+        print(f"DKIM records exist: {records_exist['dkim']}")
+        print(f"DMARC records exist: {records_exist['dmarc']}")
+        print()
+
+        if print_only:
+            print_dns_records(dns_records)
+            return None
+
+        if any(records_exist.values()):
+            if not force:
+                message = "Email DNS records already exist for this domain."
+                rprint(f"[bold red]{message}[/bold red]")
+                message = "Pass the --force flag to add the records anyway."
+                rprint(f"[bold]{message}[/bold]")
+                print()
+                print_dns_records(dns_records)
+                raise typer.Abort()
+
+            # Only collect the full lists once we know they are going to be deleted
+            email_records: dict[str, list[dict]] = classify_email_records(dns_records)
+            stale_records: list[dict] = [
+                record for kind in ("mx", "spf", "dkim", "dmarc") for record in email_records[kind]
+            ]
+
+            # Stage 1: every confirmed delete runs concurrently
+            try:
+                await delete_records(stale_records, client, cf_zone_id)
+            except DeleteRecordError as exc:
+                rprint(f"[bold red]{escape(str(exc))}[/bold red]")
+                rprint("[bold]No new records were created.[/bold]")
+                raise typer.Exit(1) from None
+
+        # Stage 2: the new records are created once the old ones are gone
+        try:
+            await create_email_records_batch(client, cf_zone_id)
+        except CreateRecordError as exc:
+            rprint(f"[bold red]{escape(str(exc))}[/bold red]")
+            raise typer.Exit(1) from None
+
+        # Stage 3: read back the zone to show the result
+        try:
+            updated_dns_records = await retrieve_dns_records(client, cf_zone_id)
+        except ZoneNotFoundError:
+            rprint("[bold red]Records were created, but the updated DNS records could not be retrieved[/bold red]")
+            raise typer.Exit(1) from None
+
+    print_dns_records(updated_dns_records)
 
     return None
 
@@ -331,76 +730,12 @@ def main(
 
     set_logging_level(verbosity)
 
-    cf_api_key, cf_api_email = retrieve_cf_credentials()
-
-    client_headers = {
-        "X-Auth-Key": cf_api_key,
-        "X-Auth-Email": cf_api_email,
-        "Content-Type": "application/json",
-    }
-
-    client = httpx.Client(base_url="https://api.cloudflare.com/client/v4", headers=client_headers)
-
-    if not cf_zone:
-        list_cf_zones(client, cf_api_email)
-        typer.Exit(0)
-
-    cf_zone_id: str = ""
-    dns_records: dict = {}
-
-    with client as client:
-        try:
-            cf_zone_id = get_zone_id(client, cf_zone)
-            logger.debug(f"{cf_zone_id=}")
-        except ZoneNotFoundError:
-            rprint("[bold red]Unable to retrieve Zone ID[/bold red]")
-            typer.Exit(1)
-
-        dns_records = retrieve_dns_records(client, cf_zone_id)
-
-    mx_records: list[dict] = parse_for_mx_records(dns_records)
-    spf_records: list[dict] = parse_for_spf_records(dns_records)
-    dkim_records: list[dict] = parse_for_dkim_records(dns_records)
-    dmarc_records: list[dict] = parse_for_dmarc_records(dns_records)
-
-    print(f"MX records exist: {bool(mx_records)}")
-    print(f"SPF records exist: {bool(spf_records)}")
-    print(f"DKIM records exist: {bool(dkim_records)}")
-    print(f"DMARC records exist: {bool(dmarc_records)}")
-    print()
+    settings = retrieve_cf_credentials()
 
-    if print_only:
-        print_dns_records(dns_records)
-        return None
-
-    # Re-open the client
-    client = httpx.Client(base_url="https://api.cloudflare.com/client/v4", headers=client_headers)
-
-    with client as client:
-        if mx_records or spf_records or dkim_records or dmarc_records:
-            if not force:
-                message = "Email DNS records already exist for this domain."
-                rprint(f"[bold red]{message}[/bold red]")
-                message = "Pass the --force flag to add the records anyway."
-                rprint(f"[bold]{message}[/bold]")
-                print()
-                print_dns_records(dns_records)
-                raise typer.Abort()
-
-            if mx_records:
-                delete_records(mx_records, client, cf_zone_id)
-            if spf_records:
-                delete_records(spf_records, client, cf_zone_id)
-            if dkim_records:
-                delete_records(dkim_records, client, cf_zone_id)
-            if dmarc_records:
-                delete_records(dmarc_records, client, cf_zone_id)
-
-        create_mx_record(client, cf_zone_id)
-        create_spf_record(client, cf_zone_id)
-        create_dkim_record(client, cf_zone_id)
-        create_dmarc_record(client, cf_zone_id)
-
-        updated_dns_records = retrieve_dns_records(client, cf_zone_id)
+    try:
+        asyncio.run(run(cf_zone, print_only, force, settings))
+    except RateLimitError as exc:
+        rprint(f"[bold red]{exc}[/bold red]")
+        raise typer.Exit(1) from None
 
-    print_dns_records(updated_dns_records)
+    return None
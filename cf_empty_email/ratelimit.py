@@ -0,0 +1,121 @@
+import asyncio
+import math
+import random
+import time
+
+import httpx
+from loguru import logger
+from rich import print as rprint
+
+# Cloudflare allows 1200 requests per 5 minutes per user. Stay under it with some headroom:
+# the bucket refills at 1100 requests per 5 minutes and holds at most 100, so no 5 minute
+# window can ever see more than 1200 requests.
+RATE_LIMIT_REQUESTS: int = 1_100
+RATE_LIMIT_PERIOD: float = 300.0
+RATE_LIMIT_BURST: int = 100
+
+MAX_RETRIES: int = 5
+BACKOFF_BASE: float = 1.0
+BACKOFF_MAX: float = 60.0
+
+# Fail rather than keep the CLI waiting for longer than this across all retries of a request
+MAX_RETRY_WAIT: float = 120.0
+
+# Nothing else is printed while waiting, so say so when a wait is longer than this
+RETRY_NOTICE_AFTER: float = 5.0
+
+
+class RateLimitError(Exception):
+    """Raised when retrying a rate limited request would wait for longer than MAX_RETRY_WAIT."""
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f"Rate limited by Cloudflare, try again in {math.ceil(retry_after)}s")
+        self.retry_after: float = retry_after
+
+
+class TokenBucket:
+    """Asyncio token bucket that hands out one token per request."""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now: float = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        return None
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+
+        async with self.lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+        return None
+
+
+def retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Return how long to wait before retrying a rate limited request.
+
+    Waits exactly as long as the Retry-After header asks when Cloudflare sends one,
+    otherwise backs off exponentially with full jitter, capped at BACKOFF_MAX.
+    """
+
+    retry_after: str | None = response.headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            pass
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))  # nosec B311
+
+
+class RateLimitedClient(httpx.AsyncClient):
+    """httpx.AsyncClient that throttles requests and retries on HTTP 429.
+
+    Raises RateLimitError instead of retrying once the total wait would go past MAX_RETRY_WAIT.
+    """
+
+    def __init__(self, *args, bucket: TokenBucket | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.bucket: TokenBucket = bucket or TokenBucket(RATE_LIMIT_REQUESTS / RATE_LIMIT_PERIOD, RATE_LIMIT_BURST)
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        attempt: int = 0
+        waited: float = 0.0
+
+        while True:
+            await self.bucket.acquire()
+
+            # A response hook may already have raised the 429 as an HTTPStatusError
+            try:
+                response: httpx.Response = await super().send(request, **kwargs)
+            except httpx.HTTPStatusError as exc:
+                if exc.response.status_code != httpx.codes.TOO_MANY_REQUESTS or attempt >= MAX_RETRIES:
+                    raise
+                response = exc.response
+            else:
+                if response.status_code != httpx.codes.TOO_MANY_REQUESTS or attempt >= MAX_RETRIES:
+                    return response
+
+            delay: float = retry_delay(response, attempt)
+            await response.aclose()
+            if waited + delay > MAX_RETRY_WAIT:
+                raise RateLimitError(delay)
+
+            logger.debug(f"Rate limited on {request.method} {request.url.path}, retrying in {delay:.1f}s")
+            if delay > RETRY_NOTICE_AFTER:
+                rprint(f"[yellow]Rate limited by Cloudflare, retrying in {math.ceil(delay)}s[/yellow]")
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
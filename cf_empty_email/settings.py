@@ -0,0 +1,24 @@
+import functools
+
+import httpx
+from pydantic import EmailStr, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(frozen=True)
+
+    cf_api_key: str = Field(pattern=r"^[a-zA-Z0-9_]*$")
+    cf_api_email: EmailStr
+
+    @functools.cached_property
+    def headers(self) -> httpx.Headers:
+        """Headers that authenticate requests to the Cloudflare API."""
+
+        return httpx.Headers(
+            {
+                "X-Auth-Key": self.cf_api_key,
+                "X-Auth-Email": self.cf_api_email,
+                "Content-Type": "application/json",
+            }
+        )
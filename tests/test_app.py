@@ -1,11 +1,41 @@
+import asyncio
+import hashlib
+import io
+import json
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+from types import MappingProxyType
+
+import httpx
 import pytest
+import typer
+from loguru import logger
 
+import cf_empty_email.app
 from cf_empty_email.app import (
+    CreateRecordError,
+    DeleteRecordError,
+    ZoneNotFoundError,
+    _get_settings,
+    classify_email_records,
+    create_email_records_batch,
+    delete_records,
+    email_record_kind,
+    email_records_exist,
+    get_zone_id,
     parse_for_dkim_records,
     parse_for_dmarc_records,
     parse_for_mx_records,
     parse_for_spf_records,
+    print_dns_records,
+    retrieve_cf_credentials,
+    retrieve_dns_records,
+    run,
+    set_logging_level,
+    zone_cache_path,
 )
+from cf_empty_email.ratelimit import RateLimitError
+from cf_empty_email.settings import Settings
 
 zone_id: str = ""
 zone_name: str = "example.net"
@@ -32,117 +62,107 @@ id_list: list[str] = [
 ]
 
 
+def mock_client(handler: Callable[[httpx.Request], httpx.Response]) -> httpx.AsyncClient:
+    """Return an AsyncClient whose requests are answered by handler."""
+
+    return httpx.AsyncClient(base_url="https://api.example.net", transport=httpx.MockTransport(handler))
+
+
+def mock_zone_cache_file() -> Path:
+    """Return the zone cache file used by mock_client, which sends no X-Auth-Email header."""
+
+    digest: str = hashlib.sha256(b"").hexdigest()[:16]
+
+    return cf_empty_email.app.ZONE_CACHE_DIR / f"zones-{digest}.json"
+
+
+def run_with_mock_client[T](
+    handler: Callable[[httpx.Request], httpx.Response], call: Callable[[httpx.AsyncClient], Awaitable[T]]
+) -> T:
+    """Run call against a mock client in a fresh event loop and return its result."""
+
+    async def run_call() -> T:
+        async with mock_client(handler) as client:
+            return await call(client)
+
+    return asyncio.run(run_call())
+
+
+# Placeholder values shared by every record, read-only so they can be shared safely
+_META: MappingProxyType = MappingProxyType({})
+_SETTINGS: MappingProxyType = MappingProxyType({})
+_TAGS: tuple = (...,)
+
+# Fields shared by the placeholder non-email related DNS records
+_COMMON: dict = {
+    "zone_id": zone_id,
+    "zone_name": zone_name,
+    "proxiable": True,
+    "proxied": False,
+    "settings": _SETTINGS,
+    "meta": _META,
+    "comment": None,
+    "tags": _TAGS,
+}
+
+# id, type, content, name, ttl, created_on, modified_on
+_OTHER_PARAMS: list[tuple[str, str, str, str, int, str, str]] = [
+    (id_list[0], "A", "10.1.1.1", host_name, 1, "2023-12-15T22:53:29.695701Z", "2024-10-21T16:25:33.288853Z"),
+    (id_list[1], "A", "10.1.1.2", host_name, 1, "2023-12-15T22:53:29.695701Z", "2024-10-21T16:25:33.288853Z"),
+    (id_list[2], "A", "10.1.1.3", host_name, 1, "2023-12-15T22:53:29.695701Z", "2024-10-21T16:25:33.288853Z"),
+    (
+        id_list[3],
+        "AAAA",
+        "fd12:3456:789a:1::1",
+        host_name,
+        1,
+        "2023-12-15T22:53:29.640148Z",
+        "2024-10-21T16:25:51.889319Z",
+    ),
+    (
+        id_list[4],
+        "CNAME",
+        f"sig1.dkim.{zone_name}",
+        f"sig1._domainkey.{zone_name}",
+        3600,
+        "2025-01-05T04:04:43.844386Z",
+        "2025-01-05T04:04:43.844386Z",
+    ),
+    (
+        id_list[5],
+        "CNAME",
+        f"alias.{zone_name}",
+        f"www.{zone_name}",
+        1,
+        "2023-12-15T22:53:29.741852Z",
+        "2024-10-21T16:26:46.847953Z",
+    ),
+]
+
+_OTHER_DNS_RECORDS: tuple[dict, ...] = tuple(
+    {
+        **_COMMON,
+        "id": record_id,
+        "type": record_type,
+        "content": content,
+        "name": name,
+        "ttl": ttl,
+        "created_on": created_on,
+        "modified_on": modified_on,
+    }
+    for record_id, record_type, content, name, ttl, created_on, modified_on in _OTHER_PARAMS
+)
+
+
 # Placeholder non-email related DNS records
-@pytest.fixture()
+# The record fixtures are session scoped, so tests must only read them, never mutate them
+@pytest.fixture(scope="session")
 def test_other_dns_records() -> list[dict]:
-    return [
-        {
-            "id": id_list[0],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": host_name,
-            "type": "A",
-            "content": "10.1.1.1",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 1,
-            "settings": {},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2023-12-15T22:53:29.695701Z",
-            "modified_on": "2024-10-21T16:25:33.288853Z",
-        },
-        {
-            "id": id_list[1],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": host_name,
-            "type": "A",
-            "content": "10.1.1.2",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 1,
-            "settings": {},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2023-12-15T22:53:29.695701Z",
-            "modified_on": "2024-10-21T16:25:33.288853Z",
-        },
-        {
-            "id": id_list[2],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": host_name,
-            "type": "A",
-            "content": "10.1.1.3",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 1,
-            "settings": {},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2023-12-15T22:53:29.695701Z",
-            "modified_on": "2024-10-21T16:25:33.288853Z",
-        },
-        {
-            "id": id_list[3],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": host_name,
-            "type": "AAAA",
-            "content": "fd12:3456:789a:1::1",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 1,
-            "settings": {},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2023-12-15T22:53:29.640148Z",
-            "modified_on": "2024-10-21T16:25:51.889319Z",
-        },
-        {
-            "id": id_list[4],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": f"sig1._domainkey.{zone_name}",
-            "type": "CNAME",
-            "content": f"sig1.dkim.{zone_name}",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 3600,
-            "settings": {...},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2025-01-05T04:04:43.844386Z",
-            "modified_on": "2025-01-05T04:04:43.844386Z",
-        },
-        {
-            "id": id_list[5],
-            "zone_id": zone_id,
-            "zone_name": zone_name,
-            "name": f"www.{zone_name}",
-            "type": "CNAME",
-            "content": f"alias.{zone_name}",
-            "proxiable": True,
-            "proxied": False,
-            "ttl": 1,
-            "settings": {...},
-            "meta": {...},
-            "comment": None,
-            "tags": [...],
-            "created_on": "2023-12-15T22:53:29.741852Z",
-            "modified_on": "2024-10-21T16:26:46.847953Z",
-        },
-    ]
+    return list(_OTHER_DNS_RECORDS)
 
 
 # Placeholder MX DNS records
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def test_mx_dns_records() -> list[dict]:
     return [
         {
@@ -156,10 +176,10 @@ def test_mx_dns_records() -> list[dict]:
             "proxiable": False,
             "proxied": False,
             "ttl": 3600,
-            "settings": {},
-            "meta": {...},
+            "settings": _SETTINGS,
+            "meta": _META,
             "comment": None,
-            "tags": [...],
+            "tags": _TAGS,
             "created_on": "2025-01-05T04:04:43.843635Z",
             "modified_on": "2025-01-05T04:04:43.843635Z",
         },
@@ -174,10 +194,10 @@ def test_mx_dns_records() -> list[dict]:
             "proxiable": False,
             "proxied": False,
             "ttl": 3600,
-            "settings": {},
-            "meta": {...},
+            "settings": _SETTINGS,
+            "meta": _META,
             "comment": None,
-            "tags": [...],
+            "tags": _TAGS,
             "created_on": "2025-01-05T04:04:43.834101Z",
             "modified_on": "2025-01-05T04:04:43.834101Z",
         },
@@ -185,7 +205,7 @@ def test_mx_dns_records() -> list[dict]:
 
 
 # Placeholder TXT DNS records
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def test_spf_dns_records() -> list[dict]:
     return [
         {
@@ -198,17 +218,17 @@ def test_spf_dns_records() -> list[dict]:
             "proxiable": False,
             "proxied": False,
             "ttl": 3600,
-            "settings": {},
-            "meta": {...},
+            "settings": _SETTINGS,
+            "meta": _META,
             "comment": None,
-            "tags": [...],
+            "tags": _TAGS,
             "created_on": "2025-01-05T04:04:43.847471Z",
             "modified_on": "2025-01-05T04:04:43.847471Z",
         },
     ]
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def test_dmarc_dns_records() -> list[dict]:
     return [
         {
@@ -221,10 +241,10 @@ def test_dmarc_dns_records() -> list[dict]:
             "proxiable": False,
             "proxied": False,
             "ttl": 1,
-            "settings": {},
-            "meta": {...},
+            "settings": _SETTINGS,
+            "meta": _META,
             "comment": "DMARC reject all record",
-            "tags": [...],
+            "tags": _TAGS,
             "created_on": "2025-01-06T19:45:22.271215Z",
             "modified_on": "2025-01-06T19:45:22.271215Z",
             "comment_modified_on": "2025-01-06T19:45:22.271215Z",
@@ -232,7 +252,7 @@ def test_dmarc_dns_records() -> list[dict]:
     ]
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def test_dkim_dns_records() -> list[dict]:
     return [
         {
@@ -245,10 +265,10 @@ def test_dkim_dns_records() -> list[dict]:
             "proxiable": False,
             "proxied": False,
             "ttl": 1,
-            "settings": {},
-            "meta": {...},
+            "settings": _SETTINGS,
+            "meta": _META,
             "comment": "Reject all DKIM record",
-            "tags": [...],
+            "tags": _TAGS,
             "created_on": "2025-01-06T19:45:22.065941Z",
             "modified_on": "2025-01-06T19:45:22.065941Z",
             "comment_modified_on": "2025-01-06T19:45:22.065941Z",
@@ -256,37 +276,514 @@ def test_dkim_dns_records() -> list[dict]:
     ]
 
 
-def test_parse_for_mx_records(test_other_dns_records: list[dict], test_mx_dns_records: list[dict]) -> None:
-    mx_records = parse_for_mx_records(test_other_dns_records)
-    assert len(mx_records) == 0
+# The placeholder records combined with each kind of email record
+@pytest.fixture(scope="session")
+def combined_mx(test_other_dns_records: list[dict], test_mx_dns_records: list[dict]) -> list[dict]:
+    return test_other_dns_records + test_mx_dns_records
+
+
+@pytest.fixture(scope="session")
+def combined_spf(test_other_dns_records: list[dict], test_spf_dns_records: list[dict]) -> list[dict]:
+    return test_other_dns_records + test_spf_dns_records
+
+
+@pytest.fixture(scope="session")
+def combined_dmarc(test_other_dns_records: list[dict], test_dmarc_dns_records: list[dict]) -> list[dict]:
+    return test_other_dns_records + test_dmarc_dns_records
+
+
+@pytest.fixture(scope="session")
+def combined_dkim(test_other_dns_records: list[dict], test_dkim_dns_records: list[dict]) -> list[dict]:
+    return test_other_dns_records + test_dkim_dns_records
+
+
+@pytest.mark.parametrize(
+    ("parser", "combined_fixture", "expected"),
+    [
+        (parse_for_mx_records, "combined_mx", 2),
+        (parse_for_spf_records, "combined_spf", 1),
+        (parse_for_dmarc_records, "combined_dmarc", 1),
+        (parse_for_dkim_records, "combined_dkim", 1),
+    ],
+    ids=["mx", "spf", "dmarc", "dkim"],
+)
+def test_parse_for_records(
+    request: pytest.FixtureRequest,
+    test_other_dns_records: list[dict],
+    parser: Callable[[list[dict]], list[dict]],
+    combined_fixture: str,
+    expected: int,
+) -> None:
+    assert len(parser(test_other_dns_records)) == 0
+
+    assert len(parser(request.getfixturevalue(combined_fixture))) == expected
+
+
+def test_classify_email_records(
+    test_other_dns_records: list[dict],
+    test_mx_dns_records: list[dict],
+    test_spf_dns_records: list[dict],
+    test_dmarc_dns_records: list[dict],
+    test_dkim_dns_records: list[dict],
+) -> None:
+    email_records = classify_email_records(test_other_dns_records)
+    assert all(len(records) == 0 for records in email_records.values())
+
+    test_records = (
+        test_other_dns_records
+        + test_mx_dns_records
+        + test_spf_dns_records
+        + test_dmarc_dns_records
+        + test_dkim_dns_records
+    )
+    email_records = classify_email_records(test_records)
+    assert email_records["mx"] == test_mx_dns_records
+    assert email_records["spf"] == test_spf_dns_records
+    assert email_records["dmarc"] == test_dmarc_dns_records
+    assert email_records["dkim"] == test_dkim_dns_records
+
+
+def test_create_email_records_batch_falls_back_to_single_posts() -> None:
+    requested_paths: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_paths.append(request.url.path)
+        assert request.headers["Content-Type"] == "application/json"
+        if request.url.path.endswith("/batch"):
+            assert len(json.loads(request.content)["posts"]) == 5
+            return httpx.Response(405)
+        return httpx.Response(200, json={"success": True})
+
+    run_with_mock_client(handler, lambda client: create_email_records_batch(client, "zone"))
+
+    assert requested_paths[0] == "/zones/zone/dns_records/batch"
+    assert requested_paths[1:] == ["/zones/zone/dns_records"] * 5
+
+
+@pytest.mark.parametrize("status_code", [400, 401, 403, 429, 500])
+def test_create_email_records_batch_does_not_fall_back_on_other_errors(status_code: int) -> None:
+    requested_paths: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_paths.append(request.url.path)
+        return httpx.Response(status_code)
+
+    with pytest.raises(CreateRecordError):
+        run_with_mock_client(handler, lambda client: create_email_records_batch(client, "zone"))
+
+    assert requested_paths == ["/zones/zone/dns_records/batch"]
+
+
+def test_delete_records_only_deletes_confirmed(
+    monkeypatch: pytest.MonkeyPatch, test_mx_dns_records: list[dict]
+) -> None:
+    deleted_paths: list[str] = []
+    answers = iter([True, False])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        deleted_paths.append(request.url.path)
+        return httpx.Response(200, json={"success": True})
+
+    monkeypatch.setattr("typer.confirm", lambda *args, **kwargs: next(answers))
+
+    run_with_mock_client(handler, lambda client: delete_records(test_mx_dns_records, client, "zone"))
+
+    assert deleted_paths == [f"/zones/zone/dns_records/{test_mx_dns_records[0]['id']}"]
+
+
+def test_delete_records_reports_every_failure(monkeypatch: pytest.MonkeyPatch, combined_mx: list[dict]) -> None:
+    failing_ids = {combined_mx[0]["id"], combined_mx[-1]["id"]}
+    deleted_paths: list[str] = []
 
+    def handler(request: httpx.Request) -> httpx.Response:
+        deleted_paths.append(request.url.path)
+        return httpx.Response(500 if request.url.path.rsplit("/", 1)[-1] in failing_ids else 200)
+
+    monkeypatch.setattr("typer.confirm", lambda *args, **kwargs: True)
+
+    with pytest.raises(DeleteRecordError) as exc_info:
+        run_with_mock_client(handler, lambda client: delete_records(combined_mx, client, "zone"))
+
+    # Every delete is still attempted, and every failure is named
+    assert len(deleted_paths) == len(combined_mx)
+    assert all(record_id in str(exc_info.value) for record_id in failing_ids)
+
+
+def test_delete_records_reports_rate_limit(monkeypatch: pytest.MonkeyPatch, test_mx_dns_records: list[dict]) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise RateLimitError(300)
+
+    monkeypatch.setattr("typer.confirm", lambda *args, **kwargs: True)
+
+    with pytest.raises(DeleteRecordError, match="try again in 300s"):
+        run_with_mock_client(handler, lambda client: delete_records(test_mx_dns_records, client, "zone"))
+
+
+def test_create_email_records_batch_fallback_reports_failed_records() -> None:
+    requested_paths: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested_paths.append(request.url.path)
+        if request.url.path.endswith("/batch"):
+            return httpx.Response(404)
+        if b"v=spf1" in request.content:
+            return httpx.Response(400)
+        return httpx.Response(200, json={"success": True})
+
+    with pytest.raises(CreateRecordError, match="SPF"):
+        run_with_mock_client(handler, lambda client: create_email_records_batch(client, "zone"))
+
+    assert len(requested_paths) == 6
+
+
+def test_get_zone_id_uses_zone_cache(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    requests_made: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_made.append(request.url.path)
+        return httpx.Response(200, json={"result": [{"name": zone_name, "id": id_list[0]}]})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    assert run_with_mock_client(handler, lambda client: get_zone_id(client, zone_name)) == id_list[0]
+
+    # Forget the in-memory index so the second lookup has to come from the disk cache
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+    disk_reads: list[Path] = []
+    read_bytes = Path.read_bytes
+
+    def counting_read_bytes(path: Path) -> bytes:
+        disk_reads.append(path)
+        return read_bytes(path)
+
+    monkeypatch.setattr(Path, "read_bytes", counting_read_bytes)
+
+    assert run_with_mock_client(handler, lambda client: get_zone_id(client, zone_name)) == id_list[0]
+    assert requests_made == ["/zones"]
+    assert disk_reads == [mock_zone_cache_file()]
+
+
+def test_zone_cache_keeps_only_names_and_ids(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    zone: dict = {
+        "name": zone_name,
+        "id": id_list[0],
+        "owner": {"email": "owner@example.net"},
+        "account": {"id": id_list[1], "name": "Example Account"},
+    }
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"result": [zone]})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    run_with_mock_client(handler, lambda client: get_zone_id(client, zone_name))
+
+    # Nothing but the cache file itself is left behind, readable only by the user
+    (cache_file,) = tmp_path.iterdir()
+    assert json.loads(cache_file.read_text()) == [{"name": zone_name, "id": id_list[0]}]
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+
+
+def test_zone_cache_is_dropped_on_client_error(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(403, json={"success": False})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    mock_zone_cache_file().write_text("[]")
+
+    with pytest.raises(ZoneNotFoundError):
+        run_with_mock_client(handler, lambda client: get_zone_id(client, zone_name))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_zone_cache_is_dropped_when_zone_records_are_not_found(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/zones":
+            return httpx.Response(200, json={"result": [{"name": zone_name, "id": id_list[2]}]})
+        return httpx.Response(404, json={"success": False})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    async def lookup(client: httpx.AsyncClient) -> None:
+        await retrieve_dns_records(client, await get_zone_id(client, zone_name))
+
+    with pytest.raises(ZoneNotFoundError):
+        run_with_mock_client(handler, lookup)
+
+    assert list(tmp_path.iterdir()) == []
+    assert mock_zone_cache_file() not in cf_empty_email.app._zone_indexes
+
+
+def test_retrieve_cf_credentials_validates_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CF_API_KEY", "abc_123")
+    monkeypatch.setenv("CF_API_EMAIL", f"user@{zone_name}")
+    _get_settings.cache_clear()
+
+    settings = retrieve_cf_credentials()
+    assert settings.headers["X-Auth-Key"] == "abc_123"
+    assert settings.headers["X-Auth-Email"] == f"user@{zone_name}"
+
+    monkeypatch.setenv("CF_API_KEY", "changed")
+    assert retrieve_cf_credentials() is settings
+    assert _get_settings.cache_info().hits == 1
+
+    _get_settings.cache_clear()
+
+
+def test_email_records_exist(
+    test_other_dns_records: list[dict], test_mx_dns_records: list[dict], test_dmarc_dns_records: list[dict]
+) -> None:
+    assert not any(email_records_exist(test_other_dns_records).values())
+
+    test_records = test_other_dns_records + test_mx_dns_records + test_dmarc_dns_records
+    assert email_records_exist(test_records) == {"mx": True, "spf": False, "dkim": False, "dmarc": True}
+
+
+def test_retrieve_dns_records_keeps_only_used_fields(
+    test_other_dns_records: list[dict], test_mx_dns_records: list[dict]
+) -> None:
     test_records = test_other_dns_records + test_mx_dns_records
-    mx_records = parse_for_mx_records(test_records)
-    assert len(mx_records) == 2
+    # The placeholder meta and tags values are not JSON types, so fall back to repr()
+    body = json.dumps({"result": test_records, "success": True}, default=repr).encode()
+
+    async def chunks() -> AsyncIterator[bytes]:
+        # Feed the body in small pieces so records are split across chunks
+        for i in range(0, len(body), 64):
+            yield body[i : i + 64]
 
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=chunks())
 
-def test_parse_for_spf_records(test_other_dns_records: list[dict], test_spf_dns_records: list[dict]) -> None:
-    spf_records = parse_for_spf_records(test_other_dns_records)
-    assert len(spf_records) == 0
+    dns_records = run_with_mock_client(handler, lambda client: retrieve_dns_records(client, "zone"))
 
-    test_records = test_other_dns_records + test_spf_dns_records
-    spf_records = parse_for_spf_records(test_records)
-    assert len(spf_records) == 1
+    assert dns_records == [
+        {field: record[field] for field in ("id", "type", "name", "content", "modified_on")} for record in test_records
+    ]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"<html><body>502 Bad Gateway</body></html>",
+        b'{"result": [{"id": "abc", "type": "MX"',
+        b'{"result": [{"id": "abc", "type": "MX"}]}',
+    ],
+    ids=["html", "truncated", "missing-field"],
+)
+def test_retrieve_dns_records_rejects_unexpected_bodies(content: bytes) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=content)
+
+    with pytest.raises(ZoneNotFoundError):
+        run_with_mock_client(handler, lambda client: retrieve_dns_records(client, "zone"))
+
+
+def test_get_zone_id_rejects_unsuccessful_listing(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"success": False})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    with pytest.raises(ZoneNotFoundError):
+        run_with_mock_client(handler, lambda client: get_zone_id(client, zone_name))
+
+
+def test_set_logging_level_is_reentrant(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Log to a private sink, starting from a throwaway handler, so the session's stderr handler is untouched
+    sink = io.StringIO()
+    monkeypatch.setattr("cf_empty_email.app.stderr", sink)
+    monkeypatch.setattr("cf_empty_email.app._log_handler_id", logger.add(sink))
+    monkeypatch.setattr("cf_empty_email.app._log_level", None)
+
+    removed_ids: list[int] = []
+    remove = logger.remove
+
+    def spy_remove(handler_id: int | None = None) -> None:
+        removed_ids.append(handler_id)
+        remove(handler_id)
+
+    monkeypatch.setattr(logger, "remove", spy_remove)
+
+    try:
+        set_logging_level(0)
+        error_handler_id = cf_empty_email.app._log_handler_id
+        removed_ids.clear()
+
+        # Same level again is a no-op
+        set_logging_level(0)
+        assert cf_empty_email.app._log_handler_id == error_handler_id
+        assert removed_ids == []
+
+        # A new level replaces the previous handler
+        set_logging_level(2)
+        assert cf_empty_email.app._log_handler_id != error_handler_id
+        assert removed_ids == [error_handler_id]
+        assert cf_empty_email.app._log_level == "DEBUG"
+    finally:
+        remove(cf_empty_email.app._log_handler_id)
+
+
+def test_get_zone_id_reuses_zone_index_in_process(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    requests_made: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests_made.append(request.url.path)
+        return httpx.Response(200, json={"result": [{"name": zone_name, "id": id_list[1]}]})
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+
+    async def lookup(client: httpx.AsyncClient) -> str:
+        zone_id = await get_zone_id(client, zone_name)
+        # Even without the disk cache the second lookup is answered from memory
+        zone_cache_path(client).unlink()
+        assert await get_zone_id(client, zone_name) == zone_id
+        return zone_id
+
+    assert run_with_mock_client(handler, lookup) == id_list[1]
+    assert requests_made == ["/zones"]
+
+
+def test_email_record_kind_matches_version_tags_only() -> None:
+    assert email_record_kind({"type": "TXT", "content": '"v=spf1 -all"'}) == "spf"
+    assert email_record_kind({"type": "TXT", "content": "v=DMARC1;p=reject;aspf=s"}) == "dmarc"
+    assert email_record_kind({"type": "TXT", "content": '"v=DKIM1; p="'}) == "dkim"
+    assert email_record_kind({"type": "TXT", "content": '"google-site-verification=spf-and-DKIM"'}) is None
+    assert email_record_kind({"type": "CNAME", "content": "v=spf1.example.net"}) is None
 
 
-def test_parse_for_dmarc_records(test_other_dns_records: list[dict], test_dmarc_dns_records: list[dict]) -> None:
-    dmarc_records = parse_for_dmarc_records(test_other_dns_records)
-    assert len(dmarc_records) == 0
+def mock_api_handler(
+    dns_records: list[dict],
+    requests_made: list[tuple[str, str]],
+    write_status: Callable[[httpx.Request], int] = lambda request: 200,
+) -> Callable[[httpx.Request], httpx.Response]:
+    """Return a handler for a fake Cloudflare API holding dns_records in a zone with ID "zone"."""
 
-    test_records = test_other_dns_records + test_dmarc_dns_records
-    dmarc_records = parse_for_dmarc_records(test_records)
-    assert len(dmarc_records) == 1
+    # The placeholder meta and tags values are not JSON types, so fall back to repr()
+    body = json.dumps({"result": dns_records}, default=repr).encode()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/client/v4")
+        requests_made.append((request.method, path))
+        if path == "/zones":
+            return httpx.Response(200, json={"result": [{"name": zone_name, "id": "zone"}]})
+        if request.method == "GET":
+            return httpx.Response(200, content=body)
+        return httpx.Response(write_status(request), json={})
+
+    return handler
+
+
+def run_with_mock_api(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, handler: Callable[[httpx.Request], httpx.Response]
+) -> None:
+    """Run the --force flow for zone_name against handler, confirming every delete."""
+
+    build_client = cf_empty_email.app.build_client
+
+    def build_mock_client(client_headers: httpx.Headers) -> httpx.AsyncClient:
+        return build_client(client_headers, transport=httpx.MockTransport(handler))
+
+    monkeypatch.setattr("cf_empty_email.app.ZONE_CACHE_DIR", tmp_path)
+    monkeypatch.setattr("cf_empty_email.app._zone_indexes", {})
+    monkeypatch.setattr("cf_empty_email.app.build_client", build_mock_client)
+    monkeypatch.setattr("typer.confirm", lambda *args, **kwargs: True)
+
+    settings = Settings(cf_api_key="abc_123", cf_api_email=f"user@{zone_name}")
+    asyncio.run(run(zone_name, print_only=False, force=True, settings=settings))
+
+
+def test_run_force_deletes_then_creates(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    test_other_dns_records: list[dict],
+    test_mx_dns_records: list[dict],
+    test_spf_dns_records: list[dict],
+) -> None:
+    requests_made: list[tuple[str, str]] = []
+    handler = mock_api_handler(test_other_dns_records + test_mx_dns_records + test_spf_dns_records, requests_made)
+
+    run_with_mock_api(monkeypatch, tmp_path, handler)
+
+    deletes = [path for method, path in requests_made if method == "DELETE"]
+    assert sorted(deletes) == sorted(
+        f"/zones/zone/dns_records/{record['id']}" for record in test_mx_dns_records + test_spf_dns_records
+    )
+    assert requests_made[-2:] == [("POST", "/zones/zone/dns_records/batch"), ("GET", "/zones/zone/dns_records")]
+
+
+def test_run_force_does_not_create_after_failed_delete(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, capsys: pytest.CaptureFixture[str], combined_mx: list[dict]
+) -> None:
+    requests_made: list[tuple[str, str]] = []
+    failing_id = combined_mx[-1]["id"]
+    handler = mock_api_handler(
+        combined_mx, requests_made, lambda request: 500 if request.url.path.endswith(failing_id) else 200
+    )
+
+    with pytest.raises(typer.Exit) as exc_info:
+        run_with_mock_api(monkeypatch, tmp_path, handler)
+
+    assert exc_info.value.exit_code == 1
+    assert failing_id in capsys.readouterr().out
+
+    assert [method for method, path in requests_made if method == "DELETE"] == ["DELETE", "DELETE"]
+    assert ("POST", "/zones/zone/dns_records/batch") not in requests_made
+
+
+def test_print_dns_records_keeps_long_values(capsys: pytest.CaptureFixture[str]) -> None:
+    content = '"v=DKIM1; k=rsa; p=' + "MIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEA" * 5 + '"'
+    record = {
+        "modified_on": "2025-01-05T04:04:43.844386Z",
+        "name": f"google._domainkey.{zone_name}",
+        "type": "TXT",
+        "content": content,
+    }
+
+    print_dns_records([record])
+    output = capsys.readouterr().out
+
+    assert "…" not in output
+    assert record["modified_on"] in output
+    assert record["name"] in output
+    # Long values are folded across lines, so compare without the inserted whitespace
+    assert "".join(content.split()) in "".join(output.split())
+
+
+@pytest.mark.parametrize(
+    ("failing_method", "message"),
+    [
+        ("GET", "Unable to retrieve DNS records"),
+        ("POST", "Unable to create records"),
+    ],
+    ids=["retrieve", "create"],
+)
+def test_run_reports_api_errors(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+    test_other_dns_records: list[dict],
+    failing_method: str,
+    message: str,
+) -> None:
+    requests_made: list[tuple[str, str]] = []
+    api_handler = mock_api_handler(test_other_dns_records, requests_made)
 
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == failing_method and request.url.path.endswith(
+            "/dns_records" if failing_method == "GET" else "/batch"
+        ):
+            return httpx.Response(403)
+        return api_handler(request)
 
-def test_parse_for_dkim_records(test_other_dns_records: list[dict], test_dkim_dns_records: list[dict]) -> None:
-    dkim_records = parse_for_dkim_records(test_other_dns_records)
-    assert len(dkim_records) == 0
+    with pytest.raises(typer.Exit) as exc_info:
+        run_with_mock_api(monkeypatch, tmp_path, handler)
 
-    test_records = test_other_dns_records + test_dkim_dns_records
-    dkim_records = parse_for_dkim_records(test_records)
-    assert len(dkim_records) == 1
+    assert exc_info.value.exit_code == 1
+    assert message in capsys.readouterr().out
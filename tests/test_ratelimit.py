@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+
+from cf_empty_email.ratelimit import (
+    BACKOFF_MAX,
+    MAX_RETRIES,
+    MAX_RETRY_WAIT,
+    RateLimitedClient,
+    RateLimitError,
+    TokenBucket,
+    retry_delay,
+)
+
+
+def test_retry_delay_honors_retry_after() -> None:
+    response = httpx.Response(429, headers={"Retry-After": "7"})
+    assert retry_delay(response, attempt=0) == 7
+
+
+def test_retry_delay_does_not_cap_retry_after() -> None:
+    # Cloudflare blocks a client for 5 minutes once the limit is hit
+    response = httpx.Response(429, headers={"Retry-After": "300"})
+    assert retry_delay(response, attempt=0) == 300
+
+
+def test_retry_delay_backs_off_exponentially(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Return the upper bound of the jitter range, so the backoff itself can be checked
+    monkeypatch.setattr("cf_empty_email.ratelimit.random.uniform", lambda low, high: high)
+    response = httpx.Response(429)
+
+    assert [retry_delay(response, attempt) for attempt in range(4)] == [1, 2, 4, 8]
+    assert retry_delay(response, attempt=10) == BACKOFF_MAX
+
+
+def test_token_bucket_waits_when_empty() -> None:
+    async def drain() -> float:
+        bucket = TokenBucket(rate=100, capacity=1)
+        await bucket.acquire()
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire()
+        return loop.time() - start
+
+    # The second token takes 1 / rate seconds to refill
+    assert asyncio.run(drain()) >= 0.009
+
+
+def test_rate_limited_client_retries_on_429() -> None:
+    status_codes = iter([429, 429, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(status_codes), headers={"Retry-After": "0"})
+
+    async def fetch() -> httpx.Response:
+        async with RateLimitedClient(transport=httpx.MockTransport(handler)) as client:
+            return await client.get("https://api.example.net/zones")
+
+    assert asyncio.run(fetch()).status_code == 200
+
+
+def test_rate_limited_client_gives_up_after_max_retries() -> None:
+    attempts: list[int] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(1)
+        return httpx.Response(429, headers={"Retry-After": "0"})
+
+    async def fetch() -> httpx.Response:
+        async with RateLimitedClient(transport=httpx.MockTransport(handler)) as client:
+            return await client.get("https://api.example.net/zones")
+
+    assert asyncio.run(fetch()).status_code == 429
+    assert len(attempts) == MAX_RETRIES + 1
+
+
+def test_rate_limited_client_retries_when_hook_raises() -> None:
+    status_codes = iter([429, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(status_codes), headers={"Retry-After": "0"})
+
+    async def raise_on_error_status(response: httpx.Response) -> None:
+        response.raise_for_status()
+
+    async def fetch() -> httpx.Response:
+        transport = httpx.MockTransport(handler)
+        async with RateLimitedClient(transport=transport, event_hooks={"response": [raise_on_error_status]}) as client:
+            return await client.get("https://api.example.net/zones")
+
+    assert asyncio.run(fetch()).status_code == 200
+
+
+def test_rate_limited_client_fails_instead_of_waiting_too_long() -> None:
+    attempts: list[int] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(1)
+        return httpx.Response(429, headers={"Retry-After": str(int(MAX_RETRY_WAIT) + 1)})
+
+    async def fetch() -> httpx.Response:
+        async with RateLimitedClient(transport=httpx.MockTransport(handler)) as client:
+            return await client.get("https://api.example.net/zones")
+
+    with pytest.raises(RateLimitError, match=f"try again in {int(MAX_RETRY_WAIT) + 1}s"):
+        asyncio.run(fetch())
+    assert len(attempts) == 1
+
+
+def test_rate_limited_client_announces_long_waits(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    status_codes = iter([429, 200])
+    delays: list[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(status_codes), headers={"Retry-After": "30"})
+
+    async def fake_sleep(delay: float) -> None:
+        delays.append(delay)
+
+    async def fetch() -> httpx.Response:
+        async with RateLimitedClient(transport=httpx.MockTransport(handler)) as client:
+            monkeypatch.setattr("cf_empty_email.ratelimit.asyncio.sleep", fake_sleep)
+            return await client.get("https://api.example.net/zones")
+
+    assert asyncio.run(fetch()).status_code == 200
+    assert delays == [30]
+    assert "retrying in 30s" in capsys.readouterr().out